@@ -0,0 +1,227 @@
+"""
+Admission control for the MoodNest API.
+
+Cheap endpoints (/state, /set-vibe, ...) and the expensive voice analysis
+endpoints (upload + Gemini + ElevenLabs) used to share one event loop with no
+limits, so a burst of recordings starved the dashboard. This module adds:
+
+- Per-client token buckets, with a separate budget for cheap and expensive routes
+- A bounded queue in front of the analysis work that answers 429 + Retry-After
+  once it is full, instead of piling up work
+- A dedicated thread pool for the blocking analysis work, so the event loop stays
+  free to answer cheap reads immediately
+
+Cheap routes are limited by AdmissionMiddleware. Analysis routes are admitted
+inside the handlers via run_admitted(), only when the dedup cache misses, so
+retries of an already-analyzed recording cost neither budget nor a slot.
+"""
+import os
+import math
+import time
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.responses import JSONResponse
+
+# Routes that do upload + LLM + TTS work
+EXPENSIVE_PREFIXES = ("/analyze-voice",)
+# Static mounts: one page load fans out into many asset and music range requests,
+# and they are served from disk without touching shared state, so they are not limited
+STATIC_MOUNTS = ("/app", "/music")
+
+# Tunables (override with environment variables)
+ANALYSIS_WORKERS = int(os.getenv("MOODNEST_ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE = int(os.getenv("MOODNEST_ANALYSIS_QUEUE", "4"))
+ANALYSIS_RATE_PER_MIN = float(os.getenv("MOODNEST_ANALYSIS_RATE_PER_MIN", "6"))
+ANALYSIS_BURST = float(os.getenv("MOODNEST_ANALYSIS_BURST", "3"))
+READ_RATE_PER_SEC = float(os.getenv("MOODNEST_READ_RATE_PER_SEC", "20"))
+READ_BURST = float(os.getenv("MOODNEST_READ_BURST", "40"))
+
+# Forget idle clients once we track this many
+MAX_TRACKED_CLIENTS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Spend one token. Returns 0 if admitted, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self):
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.burst
+
+
+class RateLimiter:
+    """One token bucket per client address."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    def take(self, client):
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= MAX_TRACKED_CLIENTS:
+                # Full buckets carry no state worth keeping
+                self.buckets = {k: b for k, b in self.buckets.items() if not b.is_full()}
+            bucket = self.buckets[client] = TokenBucket(self.rate, self.burst)
+        return bucket.take()
+
+
+class AnalysisGate:
+    """At most `workers` analyses run at once, at most `queue_size` wait behind them."""
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.running = 0
+        self.waiting = 0
+        self.avg_seconds = 5.0  # EWMA of analysis duration, used for Retry-After
+        self._slots = asyncio.Semaphore(workers)
+
+    async def acquire(self):
+        """Wait for a slot. Returns False right away if the queue is full."""
+        if self.running >= self.workers and self.waiting >= self.queue_size:
+            return False
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        return True
+
+    def release(self, elapsed):
+        self.running -= 1
+        self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * elapsed
+        self._slots.release()
+
+    def retry_after(self):
+        """Rough time until the queue drains by one slot."""
+        return self.avg_seconds * (self.waiting + 1) / self.workers
+
+
+class AdmissionRejected(Exception):
+    """Raised by run_admitted(); turned into a 429 by rejection_response()."""
+
+    def __init__(self, retry_after, message):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.message = message
+
+
+class AdmissionController:
+    def __init__(self):
+        self.read_limiter = RateLimiter(READ_RATE_PER_SEC, READ_BURST)
+        self.analysis_limiter = RateLimiter(ANALYSIS_RATE_PER_MIN / 60, ANALYSIS_BURST)
+        self.gate = AnalysisGate(ANALYSIS_WORKERS, ANALYSIS_QUEUE)
+        # Sized to match the gate, so admitted work never queues again in the pool
+        self.executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+        self.rejected = {"read_rate": 0, "analysis_rate": 0, "analysis_queue": 0}
+
+    async def run(self, fn, *args):
+        """Run blocking analysis work off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def run_admitted(self, client, fn, *args):
+        """
+        Charge `client`'s analysis budget, wait for a gate slot, then run `fn` in
+        the analysis pool. Raises AdmissionRejected if either limit is hit.
+        """
+        wait = self.analysis_limiter.take(client)
+        if wait:
+            self.rejected["analysis_rate"] += 1
+            raise AdmissionRejected(wait, "Too many recordings - please wait a moment")
+
+        if not await self.gate.acquire():
+            self.rejected["analysis_queue"] += 1
+            raise AdmissionRejected(self.gate.retry_after(), "MoodNest is busy - please try again shortly")
+
+        start = time.monotonic()
+        try:
+            return await self.run(fn, *args)
+        finally:
+            self.gate.release(time.monotonic() - start)
+
+    def stats(self):
+        return {
+            "analysis_running": self.gate.running,
+            "analysis_waiting": self.gate.waiting,
+            "analysis_avg_seconds": round(self.gate.avg_seconds, 3),
+            "rejected": dict(self.rejected),
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the read limit to cheap routes. Analysis routes are admitted in their handlers."""
+
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        # Let CORS preflights, static files and analysis routes through untouched
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or is_static(scope["path"])
+            or scope["path"].startswith(EXPENSIVE_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        client = scope["client"][0] if scope.get("client") else "unknown"
+        wait = self.controller.read_limiter.take(client)
+        if wait:
+            self.controller.rejected["read_rate"] += 1
+            await _reject(send, wait, "Too many requests")
+            return
+        await self.app(scope, receive, send)
+
+
+def client_address(request):
+    return request.client.host if request.client else "unknown"
+
+
+def rejection_response(exc):
+    """429 response for an AdmissionRejected (register with app.exception_handler)."""
+    return JSONResponse(
+        {"success": False, "error": exc.message},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+def is_static(path):
+    return any(path == mount or path.startswith(mount + "/") for mount in STATIC_MOUNTS)
+
+
+async def _reject(send, retry_after, message):
+    body = json.dumps({"success": False, "error": message}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
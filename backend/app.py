@@ -4,22 +4,56 @@ import json
 import re
 import base64
 import threading
+import time
+import tempfile
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi.staticfiles import StaticFiles
 
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, BackgroundTasks, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 # import speech_recognition as sr  # Removed - incompatible with Python 3.14
 import google.generativeai as genai
 from elevenlabs.client import ElevenLabs
 
+from mood_log import MoodLog
+from admission import (
+    AdmissionController, AdmissionMiddleware, AdmissionRejected, client_address, rejection_response,
+)
+from audio_cache import AnalysisCache, fingerprint_audio
+from upstream import UpstreamPool
+from static_assets import PrecompressedStaticFiles
+
 # --- 1. INITIALIZATION ---
 load_dotenv()
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-el_client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
-
-app = FastAPI(title="MoodNest Hub")
+# Created in lifespan() on top of the shared connection pool
+el_client = None
+upstream = UpstreamPool()
+
+@asynccontextmanager
+async def lifespan(app):
+    global el_client
+    # Pooled client shared by every ElevenLabs call: tunable limits, a keep-alive
+    # expiry longer than httpx's 5 s default, HTTP/2 when h2 is installed, and
+    # reuse metrics at /upstream/stats; closed when the app shuts down
+    el_client = ElevenLabs(
+        api_key=os.getenv("ELEVENLABS_API_KEY"),
+        httpx_client=upstream.client("elevenlabs"),
+    )
+    yield
+    admission.shutdown()
+    mood_log.close()
+    upstream.close()
+
+app = FastAPI(title="MoodNest Hub", lifespan=lifespan)
+
+# Rate limits + bounded analysis queue. Added before CORS so 429s still get CORS headers.
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Dedup cache for transcripts/emotion results of identical recordings
+analysis_cache = AnalysisCache()
 
 app.add_middleware(
     CORSMiddleware,
@@ -63,7 +97,7 @@ VIBE_PRESETS = {
 if not os.path.exists("music"):
     os.makedirs("music")
 
-app.mount("/music", StaticFiles(directory="music"), name="music")
+app.mount("/music", PrecompressedStaticFiles(directory="music"), name="music")
 
 
 
@@ -78,6 +112,11 @@ class MoodNestState:
 
 state = MoodNestState()
 state_lock = threading.Lock()
+# Analyses run concurrently now, but they all share one Gemini chat session
+chat_lock = threading.Lock()
+
+# Append-only history of every vibe change (see mood_log.py)
+mood_log = MoodLog(os.getenv("MOODNEST_LOG_DIR", "mood_log"))
 
 def audio_stream_to_base64(audio_data):
     """
@@ -132,6 +171,10 @@ SYSTEM_PROMPT = (
 
 # Use Gemini 2.5 Flash-Lite for higher quota
 model = genai.GenerativeModel('gemini-2.5-flash-lite', system_instruction=SYSTEM_PROMPT)
+# Shared by transcription and emotion detection instead of building one per request.
+# Gemini calls go over the SDK's long-lived gRPC (HTTP/2) channel; uploads reuse a
+# per-thread client, which stays warm because analyses run on a fixed thread pool.
+analysis_model = genai.GenerativeModel('gemini-2.5-flash-lite')
 chat_session = model.start_chat(history=[])
 
 # --- 2. CORE LOGIC ---
@@ -148,7 +191,8 @@ def process_interaction(input_text):
         state.transcript.append({"role": "user", "content": input_text})
     
     # Get Gemini response
-    response = chat_session.send_message(input_text)
+    with chat_lock:
+        response = chat_session.send_message(input_text)
     full_reply = response.text
     
     print(f"🤖 GEMINI: {full_reply}")
@@ -189,12 +233,14 @@ def process_interaction(input_text):
             # Gemini is asking for permission
             state.pending_vibe = new_vibe
             state.awaiting_confirmation = True
+            mood_log.record(new_vibe, "detected")
             print(f"❓ ASKING: Want to change to '{new_vibe}'?")
         
         elif confirmed is True and state.pending_vibe:
             # User said yes - apply the pending mood
             old_vibe = state.current_vibe
             state.current_vibe = state.pending_vibe
+            mood_log.record(state.current_vibe, "confirmed")
             print(f"✅ CONFIRMED: {old_vibe} → {state.current_vibe}")
             state.pending_vibe = None
             state.awaiting_confirmation = False
@@ -240,92 +286,164 @@ def process_interaction(input_text):
 
 # --- 3. AUDIO ANALYSIS ENDPOINTS ---
 
-@app.post("/analyze-voice-conversation")
-async def analyze_voice_conversation(audio: UploadFile = File(...)):
-    """
-    Conversational mode: Transcribes audio, has Gemini conversation,
-    and plays audio response via ElevenLabs.
-    """
+def save_temp_audio(audio_bytes):
+    """Write audio to a unique temp file (analyses can now run concurrently)."""
+    fd, temp_path = tempfile.mkstemp(prefix="moodnest_", suffix=".wav")
+    with os.fdopen(fd, "wb") as f:
+        f.write(audio_bytes)
+    return temp_path
+
+def remove_temp_audio(temp_path):
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+def transcribe_audio(audio_bytes):
+    """Upload audio to Gemini and return the spoken words."""
+    temp_path = save_temp_audio(audio_bytes)
     try:
-        # Read and save audio
-        audio_bytes = await audio.read()
-        temp_path = "temp_audio_conv.wav"
-        with open(temp_path, "wb") as f:
-            f.write(audio_bytes)
-        
-        print(f"🎤 Conversation mode - processing audio...")
-        
-        # Upload to Gemini for transcription
         audio_file = genai.upload_file(path=temp_path)
-        transcribe_model = genai.GenerativeModel('gemini-2.5-flash-lite')
-        transcribe_response = transcribe_model.generate_content([
+        transcribe_response = analysis_model.generate_content([
             "Listen to this audio and transcribe EXACTLY what is said. "
             "Return ONLY the spoken words with no additional commentary, explanations, or interpretations. "
             "If you cannot clearly hear the words, return: [unclear audio]",
             audio_file
         ])
+    finally:
+        remove_temp_audio(temp_path)
+    return transcribe_response.text.strip()
+
+EMOTION_PROMPT = """Analyze audio for emotion from voice tone only.
+
+CRITICAL RULES:
+- MUST contain clear human speech with emotional tone
+- REJECT silence, ambient noise, music, or unclear speech
+- "neutral" is ONLY for calm spoken words, NOT for absence of speech
+- If no clear speech detected, set "valid": false
+
+Return ONLY this JSON:
+{
+    "detected_emotion": "happy|sad|angry|neutral",
+    "confidence": 0.85,
+    "valid": true
+}
+
+Set "valid":false if audio lacks clear human speech."""
+
+def detect_emotion(audio_bytes):
+    """
+    Upload audio to Gemini and classify its emotion.
+    Returns {"emotion", "confidence", "valid", "fallback"}; "fallback" is True
+    when Gemini's reply could not be parsed and neutral was assumed.
+    """
+    temp_path = save_temp_audio(audio_bytes)
+    try:
+        # Upload audio to Gemini for analysis
+        print("🎵 Uploading audio to Gemini...")
+        audio_file = genai.upload_file(path=temp_path)
         
-        user_text = transcribe_response.text.strip()
-        
-        # Check if transcription failed
-        if "[unclear audio]" in user_text.lower() or len(user_text) < 1:
-            print(f"⚠️ Transcription unclear: {user_text}")
-            return {
-                "success": False,
-                "error": "Could not understand audio clearly. Please speak clearly and try again."
-            }
-        
-        print(f"💬 User said: '{user_text}'")
+        # Use Gemini 2.5 Flash-Lite with audio analysis
+        response = analysis_model.generate_content([EMOTION_PROMPT, audio_file])
+    finally:
+        remove_temp_audio(temp_path)
+    
+    # Parse Gemini response
+    try:
+        response_text = response.text.strip()
+        # Remove markdown code blocks if present
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0].strip()
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1].split("```")[0].strip()
         
-        # Clean up temp file
-        import os as os_module
-        if os_module.path.exists(temp_path):
-            try:
-                os_module.remove(temp_path)
-            except:
-                pass  # Will be overwritten next time
+        emotion_data = json.loads(response_text)
+        return {
+            "emotion": emotion_data.get("detected_emotion", "neutral"),
+            "confidence": emotion_data.get("confidence", 0.75),
+            "valid": emotion_data.get("valid", True),
+            "fallback": False,
+        }
+    except json.JSONDecodeError as e:
+        print(f"⚠️ JSON parsing error: {e}")
+        print(f"Raw response: {response.text}")
+        # Fallback to default mood
+        return {"emotion": "neutral", "confidence": 0.5, "valid": True, "fallback": True}
+
+def converse_with_audio(audio_bytes):
+    """Transcribe a recording and run one conversation turn (Gemini + ElevenLabs)."""
+    user_text = transcribe_audio(audio_bytes)
+    
+    # Check if transcription failed
+    if "[unclear audio]" in user_text.lower() or len(user_text) < 1:
+        print(f"⚠️ Transcription unclear: {user_text}")
+        return {
+            "success": False,
+            "error": "Could not understand audio clearly. Please speak clearly and try again."
+        }
+    
+    print(f"💬 User said: '{user_text}'")
+    
+    # Process through conversation (with ElevenLabs response)
+    ai_response, audio_base64 = process_interaction(user_text)
+    
+    # Return the conversation state
+    with state_lock:
+        current_mood = state.current_vibe
+        pending = state.pending_vibe
+        awaiting = state.awaiting_confirmation
+    
+    return {
+        "success": True,
+        "mode": "conversation",
+        "user_input": user_text,
+        "ai_response": ai_response,
+        "audio": audio_base64,  # Base64-encoded audio for frontend playback
+        "detected_mood": current_mood,
+        "pending_mood": pending,
+        "awaiting_confirmation": awaiting,
+        "vibe_details": VIBE_PRESETS.get(current_mood, VIBE_PRESETS["neutral"])
+    }
+
+@app.post("/analyze-voice-conversation")
+async def analyze_voice_conversation(request: Request, audio: UploadFile = File(...)):
+    """
+    Conversational mode: Transcribes audio, has Gemini conversation,
+    and plays audio response via ElevenLabs.
+    """
+    try:
+        audio_bytes = await audio.read()
         
-        # Process through conversation (with ElevenLabs response)
-        ai_response, audio_base64 = process_interaction(user_text)
+        print(f"🎤 Conversation mode - processing audio...")
         
-        # Return the conversation state
-        with state_lock:
-            current_mood = state.current_vibe
-            pending = state.pending_vibe
-            awaiting = state.awaiting_confirmation
+        # Blocking Gemini/ElevenLabs calls run in the analysis pool, not the event loop.
+        # A resubmitted recording gets the original turn back, so a retried "yes"
+        # is not applied (or logged, or spoken) twice.
+        result, reused = await analysis_cache.get_or_compute(
+            "conversation:" + fingerprint_audio(audio_bytes),
+            # Only a cache miss is charged against the client's budget and a gate slot
+            lambda: admission.run_admitted(client_address(request), converse_with_audio, audio_bytes),
+            cacheable=lambda result: result["success"],
+        )
+        if reused:
+            print("♻️ Reusing conversation turn for identical recording")
         
-        return {
-            "success": True,
-            "mode": "conversation",
-            "user_input": user_text,
-            "ai_response": ai_response,
-            "audio": audio_base64,  # Base64-encoded audio for frontend playback
-            "detected_mood": current_mood,
-            "pending_mood": pending,
-            "awaiting_confirmation": awaiting,
-            "vibe_details": VIBE_PRESETS.get(current_mood, VIBE_PRESETS["neutral"])
-        }
+        return {**result, "cached": reused}
         
+    except AdmissionRejected as e:
+        return rejection_response(e)
     except Exception as e:
         print(f"❌ Error in conversation mode: {str(e)}")
         import traceback
         traceback.print_exc()
         
-        # Clean up temp file on error
-        import os as os_module
-        if os_module.path.exists("temp_audio_conv.wav"):
-            try:
-                os_module.remove("temp_audio_conv.wav")
-            except:
-                pass  # Will be overwritten next time
-        
         return {
             "success": False,
             "error": str(e)
         }
 
 @app.post("/analyze-voice")
-async def analyze_voice(audio: UploadFile = File(...)):
+async def analyze_voice(request: Request, audio: UploadFile = File(...)):
     """
     Receives a WAV audio file and analyzes it for emotion using Gemini.
     Uses Gemini for speech-to-text transcription + emotion detection.
@@ -339,85 +457,24 @@ async def analyze_voice(audio: UploadFile = File(...)):
         print(f"📥 Received audio file: {audio.filename}")
         print(f"📊 Size: {audio_size / 1024:.2f} KB")
         
-        # Save temporarily for Gemini to process
-        temp_path = "temp_audio.wav"
-        with open(temp_path, "wb") as f:
-            f.write(audio_bytes)
+        # Identical recordings (client retries, resubmits) share one Gemini call
+        result, reused = await analysis_cache.get_or_compute(
+            "emotion:" + fingerprint_audio(audio_bytes),
+            lambda: admission.run_admitted(client_address(request), detect_emotion, audio_bytes),
+            # A parse-failure placeholder must not answer the retries meant to fix it
+            cacheable=lambda result: not result["fallback"],
+        )
+        if reused:
+            print("♻️ Reusing analysis for identical recording")
         
-        # Upload audio to Gemini for analysis
-        print("🎵 Uploading audio to Gemini...")
-        audio_file = genai.upload_file(path=temp_path)
-        
-        # Use Gemini 2.5 Flash-Lite with audio analysis
-        emotion_prompt = """Analyze audio for emotion from voice tone only.
-
-CRITICAL RULES:
-- MUST contain clear human speech with emotional tone
-- REJECT silence, ambient noise, music, or unclear speech
-- "neutral" is ONLY for calm spoken words, NOT for absence of speech
-- If no clear speech detected, set "valid": false
-
-Return ONLY this JSON:
-{
-    "detected_emotion": "happy|sad|angry|neutral",
-    "confidence": 0.85,
-    "valid": true
-}
-
-Set "valid":false if audio lacks clear human speech."""
-        
-        emotion_model = genai.GenerativeModel('gemini-2.5-flash-lite')
-        response = emotion_model.generate_content([emotion_prompt, audio_file])
-        
-        # Clean up temp file
-        import os as os_module
-        if os_module.path.exists(temp_path):
-            try:
-                os_module.remove(temp_path)
-            except:
-                pass  # Will be overwritten next time
-        
-        # Parse Gemini response
-        try:
-            response_text = response.text.strip()
-            # Remove markdown code blocks if present
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-            
-            emotion_data = json.loads(response_text)
-            
-            # Check if recording is valid for mood detection
-            if not emotion_data.get("valid", True):
-                return {
-                    "success": False,
-                    "error": "Recording not suitable for mood detection. Please speak clearly about your feelings."
-                }
-            
-            detected_mood = emotion_data.get("detected_emotion", "neutral")
-            confidence = emotion_data.get("confidence", 0.75)
-            
-            print(f"🎯 Detected mood: {detected_mood} ({confidence*100:.0f}% confidence)")
-            
-            # Update the current vibe
-            with state_lock:
-                if detected_mood in VIBE_PRESETS:
-                    state.current_vibe = detected_mood
-            
+        # Check if recording is valid for mood detection
+        if not result["valid"]:
             return {
-                "success": True,
-                "detected_mood": detected_mood,
-                "confidence": confidence,
-                "audio_size_kb": audio_size / 1024,
-                "vibe_details": VIBE_PRESETS.get(detected_mood, VIBE_PRESETS["neutral"]),
-                "message": f"Detected {detected_mood} mood"
+                "success": False,
+                "error": "Recording not suitable for mood detection. Please speak clearly about your feelings."
             }
-            
-        except json.JSONDecodeError as e:
-            print(f"⚠️ JSON parsing error: {e}")
-            print(f"Raw response: {response.text}")
-            # Fallback to default mood
+        
+        if result["fallback"]:
             detected_mood = "neutral"
             return {
                 "success": True,
@@ -425,22 +482,40 @@ Set "valid":false if audio lacks clear human speech."""
                 "confidence": 0.5,
                 "audio_size_kb": audio_size / 1024,
                 "vibe_details": VIBE_PRESETS[detected_mood],
-                "message": f"Using default mood: {detected_mood}"
+                "message": f"Using default mood: {detected_mood}",
+                "cached": reused
             }
         
+        detected_mood = result["emotion"]
+        confidence = result["confidence"]
+        
+        print(f"🎯 Detected mood: {detected_mood} ({confidence*100:.0f}% confidence)")
+        
+        # Update the current vibe
+        with state_lock:
+            if detected_mood in VIBE_PRESETS:
+                state.current_vibe = detected_mood
+                # A retried recording is the same event, so log it only once
+                if not reused:
+                    mood_log.record(detected_mood, "detected", confidence)
+        
+        return {
+            "success": True,
+            "detected_mood": detected_mood,
+            "confidence": confidence,
+            "audio_size_kb": audio_size / 1024,
+            "vibe_details": VIBE_PRESETS.get(detected_mood, VIBE_PRESETS["neutral"]),
+            "message": f"Detected {detected_mood} mood",
+            "cached": reused
+        }
+        
+    except AdmissionRejected as e:
+        return rejection_response(e)
     except Exception as e:
         print(f"❌ Error processing audio: {str(e)}")
         import traceback
         traceback.print_exc()
         
-        # Clean up temp file on error
-        import os as os_module
-        if os_module.path.exists("temp_audio.wav"):
-            try:
-                os_module.remove("temp_audio.wav")
-            except:
-                pass  # Will be overwritten next time
-        
         return {
             "success": False,
             "error": str(e)
@@ -462,6 +537,11 @@ async def root():
             "/set-mode/{mode}", 
             "/set-vibe/{vibe_name}", 
             "/action/reset", 
+            "/history/summary",
+            "/admission/stats",
+            "/cache/stats",
+            "/upstream/stats",
+            "/app (built frontend)",
             "/docs"
         ],
         "available_vibes": list(VIBE_PRESETS.keys())
@@ -509,6 +589,7 @@ async def set_vibe(vibe_name: str):
     with state_lock:
         if vibe_name in VIBE_PRESETS:
             state.current_vibe = vibe_name
+            mood_log.record(vibe_name, "manual")
             return {
                 "success": True,
                 "vibe_name": vibe_name,
@@ -528,9 +609,51 @@ async def api_reset():
         state.current_vibe = "neutral"
         state.pending_vibe = None
         state.awaiting_confirmation = False
+        mood_log.record("neutral", "reset")
     chat_session = model.start_chat(history=[])
+    # Cached turns carry pending/awaiting state the new session knows nothing about
+    analysis_cache.invalidate("conversation:")
     return {"message": "System Reset"}
 
+@app.get("/history/summary")
+async def history_summary(
+    since: float | None = Query(None, description="Start of range (epoch seconds)"),
+    until: float | None = Query(None, description="End of range (epoch seconds)"),
+    days: float | None = Query(None, description="Shortcut for since = now - days"),
+    tz_offset_minutes: int = Query(0, description="Local UTC offset for hour/weekday buckets"),
+):
+    """Aggregate vibe history: totals, per-source counts and hour/weekday distributions."""
+    if days is not None and since is None:
+        since = time.time() - days * 86400
+    return mood_log.summary(since=since, until=until, tz_offset_minutes=tz_offset_minutes)
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    """Request vs. new-connection counts for the pooled upstream clients."""
+    return upstream.stats()
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """Current analysis queue depth and rejection counters."""
+    return admission.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss/coalesced counters for the analysis dedup cache."""
+    return analysis_cache.stats()
+
+# Built frontend (npm run build:assets in frontend/), served at /app
+FRONTEND_DIST = os.getenv(
+    "MOODNEST_FRONTEND_DIST",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "dist"),
+)
+if os.path.isdir(FRONTEND_DIST):
+    app.mount(
+        "/app",
+        PrecompressedStaticFiles(directory=FRONTEND_DIST, html=True, hashed_dir="assets"),
+        name="frontend",
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
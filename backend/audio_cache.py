@@ -0,0 +1,108 @@
+"""
+Deduplication cache for voice analysis results.
+
+Clients retry on flaky networks and the frontend can resubmit the same
+recording, which used to redo the Gemini upload and analysis for identical
+bytes. Results are keyed by a hash of the audio content, kept in a TTL +
+size-bounded LRU, and concurrent requests for the same key share a single
+upstream call (single-flight).
+"""
+import io
+import os
+import time
+import wave
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+CACHE_TTL_SECONDS = float(os.getenv("MOODNEST_CACHE_TTL_SECONDS", "600"))
+CACHE_MAX_ENTRIES = int(os.getenv("MOODNEST_CACHE_MAX_ENTRIES", "256"))
+
+
+def fingerprint_audio(audio_bytes):
+    """
+    Content hash of the recording. For real WAV files only the PCM format and
+    samples are hashed, so re-muxed copies with different headers or metadata
+    chunks still match. Anything else (e.g. webm from MediaRecorder) is hashed
+    as raw bytes.
+    """
+    digest = hashlib.sha256()
+    try:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+            digest.update(f"pcm:{wav.getnchannels()}:{wav.getsampwidth()}:{wav.getframerate()}:".encode())
+            digest.update(wav.readframes(wav.getnframes()))
+    except Exception:
+        # Anything that isn't a well-formed WAV (wave raises more than wave.Error
+        # on corrupt headers) is hashed as-is
+        digest = hashlib.sha256(b"raw:")
+        digest.update(audio_bytes)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """TTL + LRU result cache with single-flight. Use from the event loop only."""
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_compute(self, key, compute, cacheable=None):
+        """
+        Return (value, reused). `compute` is a zero-argument callable returning an
+        awaitable; it only runs if the key is neither cached nor already in flight.
+        Failures are not cached, nor are values for which `cacheable(value)` is false.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], True
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        self.misses += 1
+        task = asyncio.ensure_future(compute())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t, cacheable))
+        # Shielded so a disconnecting client doesn't cancel the call for everyone else
+        return await asyncio.shield(task), False
+
+    def invalidate(self, prefix):
+        """Drop cached and in-flight results whose key starts with `prefix`."""
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+        # In-flight calls still answer their waiters, but their result won't be cached
+        for key in [k for k in self._inflight if k.startswith(prefix)]:
+            del self._inflight[key]
+
+    def _finish(self, key, task, cacheable):
+        if self._inflight.get(key) is not task:
+            return  # Invalidated while in flight
+        del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if cacheable is not None and not cacheable(task.result()):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
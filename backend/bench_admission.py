@@ -0,0 +1,110 @@
+"""
+Load test for admission control: does /state stay fast during an analysis burst?
+
+Runs the real AdmissionMiddleware in front of a stub app. The stub analysis
+route blocks a worker thread on the analysis executor the same way the Gemini +
+ElevenLabs calls do, so no API keys or network are needed.
+
+Usage: python bench_admission.py [--burst-clients 12] [--analysis-seconds 2] [--slo-ms 50]
+Exits non-zero if the /state p95 during the burst misses the SLO.
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+from fastapi import FastAPI, Request
+
+from admission import (
+    AdmissionController, AdmissionMiddleware, AdmissionRejected, client_address, rejection_response,
+)
+
+
+def build_app(analysis_seconds):
+    controller = AdmissionController()
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    @app.get("/state")
+    async def get_state():
+        return {"vibe_name": "neutral"}
+
+    @app.post("/analyze-voice")
+    async def analyze_voice(request: Request):
+        # Stand-in for upload + Gemini + TTS: blocks an analysis worker thread
+        try:
+            await controller.run_admitted(client_address(request), time.sleep, analysis_seconds)
+        except AdmissionRejected as e:
+            return rejection_response(e)
+        return {"success": True}
+
+    return app, controller
+
+
+def client_for(app, address):
+    transport = httpx.ASGITransport(app=app, client=(address, 50000))
+    return httpx.AsyncClient(transport=transport, base_url="http://moodnest")
+
+
+async def poll_state(app, duration, interval):
+    """A dashboard polling /state; returns per-request latencies in ms."""
+    latencies = []
+    async with client_for(app, "10.0.0.1") as client:
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            response = await client.get("/state")
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+            await asyncio.sleep(interval)
+    return latencies
+
+
+async def send_recordings(app, address, count):
+    async with client_for(app, address) as client:
+        responses = await asyncio.gather(*[client.post("/analyze-voice") for _ in range(count)])
+    return [r.status_code for r in responses]
+
+
+def p95(values):
+    return statistics.quantiles(values, n=20)[-1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst-clients", type=int, default=12)
+    parser.add_argument("--recordings-per-client", type=int, default=2)
+    parser.add_argument("--analysis-seconds", type=float, default=2.0)
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--slo-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    app, controller = build_app(args.analysis_seconds)
+    duration = args.analysis_seconds * 3
+
+    idle = await poll_state(app, 1.0, args.poll_interval)
+
+    burst = [
+        asyncio.create_task(send_recordings(app, f"10.1.0.{i}", args.recordings_per_client))
+        for i in range(args.burst_clients)
+    ]
+    await asyncio.sleep(0.1)  # Let the gate fill up first
+    busy = await poll_state(app, duration, args.poll_interval)
+    statuses = [code for codes in await asyncio.gather(*burst) for code in codes]
+    controller.shutdown()
+
+    print(f"/state idle:  p50 {statistics.median(idle):.2f} ms  p95 {p95(idle):.2f} ms  ({len(idle)} requests)")
+    print(f"/state burst: p50 {statistics.median(busy):.2f} ms  p95 {p95(busy):.2f} ms  ({len(busy)} requests)")
+    print(f"analysis: {statuses.count(200)} admitted, {statuses.count(429)} rejected with 429")
+    print(f"admission stats: {controller.stats()}")
+
+    if p95(busy) > args.slo_ms:
+        print(f"❌ /state p95 above the {args.slo_ms:.0f} ms SLO during the burst")
+        sys.exit(1)
+    print(f"✅ /state p95 within the {args.slo_ms:.0f} ms SLO during the burst")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
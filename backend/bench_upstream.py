@@ -0,0 +1,125 @@
+"""
+Benchmark for the pooled upstream clients (upstream.py) against a local TLS stub.
+
+Starts a loopback HTTPS server with a throwaway self-signed certificate and
+compares the baseline - one long-lived httpx.Client with default settings, which
+is what the ElevenLabs SDK builds for itself - against UpstreamPool.client("stub").
+
+Two phases:
+- back-to-back calls: both clients keep their connection, so latency should match
+- calls separated by an idle gap (default 6 s, like spaced-out recordings):
+  httpx's default 5 s keep-alive expiry drops the baseline's connection, so
+  every call pays a new TCP + TLS handshake; the pool's longer
+  MOODNEST_HTTP_KEEPALIVE_EXPIRY keeps it warm
+
+Needs the `openssl` command line tool to create the certificate.
+
+Usage: python bench_upstream.py [--calls 100] [--idle-calls 5] [--idle-gap 6]
+"""
+import os
+import ssl
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import http.server
+
+import httpx
+
+from upstream import ConnectionStats, UpstreamPool
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        # One write, so Nagle/delayed ACK doesn't add latency to every response
+        self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+
+    def log_message(self, *args):
+        pass
+
+
+def make_certificate(directory):
+    if not shutil.which("openssl"):
+        raise SystemExit("❌ openssl not found - needed to create the stub's certificate")
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def start_stub(cert, key):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def time_calls(calls, get, gap=0.0):
+    latencies = []
+    for _ in range(calls):
+        if gap:
+            time.sleep(gap)
+        start = time.perf_counter()
+        response = get()
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return latencies
+
+
+def describe(name, latencies):
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    print(f"{name:<28} mean {statistics.mean(latencies):7.2f} ms  p50 {statistics.median(latencies):7.2f} ms  p95 {p95:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--idle-calls", type=int, default=5)
+    parser.add_argument("--idle-gap", type=float, default=6.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_stub(*make_certificate(directory))
+        url = f"https://localhost:{server.server_address[1]}/"
+
+        # Baseline: a single client with httpx defaults, as the SDK creates on its own
+        baseline_stats = ConnectionStats()
+        baseline = httpx.Client(verify=False, event_hooks={"request": [baseline_stats.on_request]})
+        pool = UpstreamPool()
+        pooled = pool.client("stub", verify=False)
+
+        # Warm both up so only steady-state behavior is measured
+        baseline.get(url)
+        pooled.get(url)
+
+        print(f"-- {args.calls} back-to-back calls")
+        describe("SDK-default client", time_calls(args.calls, lambda: baseline.get(url)))
+        describe("pooled client", time_calls(args.calls, lambda: pooled.get(url)))
+
+        print(f"-- {args.idle_calls} calls, {args.idle_gap:.0f} s idle before each")
+        idle_baseline = time_calls(args.idle_calls, lambda: baseline.get(url), gap=args.idle_gap)
+        idle_pooled = time_calls(args.idle_calls, lambda: pooled.get(url), gap=args.idle_gap)
+        describe("SDK-default client", idle_baseline)
+        describe("pooled client", idle_pooled)
+        print(f"saved per idle call: {statistics.mean(idle_baseline) - statistics.mean(idle_pooled):.2f} ms")
+
+        print(f"SDK-default connections: {baseline_stats.snapshot()}")
+        print(f"pool stats: {pool.stats()}")
+
+        baseline.close()
+        pool.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
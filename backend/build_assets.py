@@ -0,0 +1,68 @@
+"""
+Post-build step for the frontend bundle (run after `vite build`, or use
+`npm run build:assets` in frontend/).
+
+Writes .br (if the `brotli` package is installed) and .gz siblings for
+compressible files, which static_assets.PrecompressedStaticFiles serves.
+
+Output files are never rewritten: Vite has already put a hash of their content
+in their names. Models are mesh-compressed in the source tree instead
+(`npm run compress:models`), before Vite hashes them.
+
+Usage: python build_assets.py [dist_dir]
+"""
+import os
+import sys
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_DIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "dist")
+
+COMPRESSIBLE = (".html", ".js", ".mjs", ".css", ".svg", ".json", ".txt", ".wasm", ".glb", ".gltf", ".bin")
+MIN_SIZE = 1024          # Not worth compressing below this
+MIN_SAVING = 0.9         # Keep a variant only if it is at most 90% of the original
+
+
+def precompress(dist):
+    if brotli is None:
+        print("⚠️ brotli not installed (pip install brotli) - writing gzip only")
+    for path in walk(dist, COMPRESSIBLE):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < MIN_SIZE:
+            continue
+        variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants[".br"] = brotli.compress(data, quality=11)
+        for suffix, compressed in variants.items():
+            if len(compressed) > len(data) * MIN_SAVING:
+                continue
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+            print(f"📦 {rel(path, dist)}{suffix}: {len(data) / 1024:.1f} KB → {len(compressed) / 1024:.1f} KB")
+
+
+def walk(dist, extensions):
+    for root, _, files in os.walk(dist):
+        for name in files:
+            if name.lower().endswith(extensions):
+                yield os.path.join(root, name)
+
+
+def rel(path, dist):
+    return os.path.relpath(path, dist)
+
+
+def main():
+    dist = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DIST
+    if not os.path.isdir(dist):
+        sys.exit(f"❌ {dist} not found - run `npm run build` in frontend/ first")
+    precompress(dist)
+
+
+if __name__ == "__main__":
+    main()
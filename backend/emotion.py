@@ -1,6 +1,9 @@
 import os
 import json
+import time
+import queue
 import threading
+import collections
 import uvicorn
 from dotenv import load_dotenv
 
@@ -10,6 +13,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 # Audio and AI Components
+import numpy as np
 import speech_recognition as sr
 import google.generativeai as genai
 from elevenlabs.client import ElevenLabs
@@ -42,6 +46,8 @@ class MoodNestState:
 
 state = MoodNestState()
 state_lock = threading.Lock()
+# Set while MoodNest's own voice is playing, so the mic doesn't transcribe it
+speaking = threading.Event()
 
 # --- 3. AI CONFIGURATION ---
 SYSTEM_PROMPT = (
@@ -93,46 +99,200 @@ def process_interaction(input_text, is_user_speech=True):
             voice_id="21m00Tcm4TlvDq8ikWAM", # Rachel
             model_id="eleven_turbo_v2_5"
         )
-        play(audio)
+        speaking.set()
+        try:
+            play(audio)
+            # Let the room echo die down before listening again
+            time.sleep(PLAYBACK_TAIL_SECONDS)
+        finally:
+            speaking.clear()
+
+# --- Wake-word pipeline ---
+# mic_capture_worker -> audio_chunks -> phrase_segmenter_worker -> utterances -> interaction_worker
+# Capture never waits on recognition or playback; only the segmenter looks for
+# the wake word (offline), and network STT runs only once MoodNest is awake.
+WAKE_WORD = "mood"
+WAKE_SENSITIVITY = 0.8        # 0-1, higher fires more easily
+PRE_ROLL_SECONDS = 0.4        # Audio kept from before speech starts
+END_SILENCE_SECONDS = 0.6     # Silence that ends a phrase
+MIN_PHRASE_SECONDS = 0.3      # Ignore clicks and pops
+MAX_PHRASE_SECONDS = 8        # Cut off very long phrases
+PLAYBACK_TAIL_SECONDS = 0.3   # Extra deaf time after MoodNest finishes speaking
+MAX_CAPTURE_ERRORS = 10       # Consecutive mic read failures before giving up
+
+audio_chunks = queue.Queue(maxsize=512)   # ~30s of 1024-sample chunks at 16kHz
+utterances = queue.Queue(maxsize=8)
+
+def chunk_rms(chunk):
+    """RMS energy of a 16-bit PCM chunk."""
+    samples = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+def put_dropping_oldest(q, item):
+    """Never block the producer: if the consumer fell behind, drop the oldest item."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+# Cleared if PocketSphinx is missing: idle phrases are never sent to online STT,
+# so without it the assistant can only be woken with POST /action/wake
+wake_word_enabled = threading.Event()
+wake_word_enabled.set()
+
+def disable_wake_word(reason):
+    wake_word_enabled.clear()
+    print(f"❌ Wake word disabled: {reason}. Install pocketsphinx (see requirements.txt) or use POST /action/wake")
+
+def heard_wake_word(recognizer, audio):
+    """Local keyword spotting with PocketSphinx. Idle audio never leaves the device."""
+    try:
+        recognizer.recognize_sphinx(audio, keyword_entries=[(WAKE_WORD, WAKE_SENSITIVITY)])
+        return True
+    except sr.UnknownValueError:
+        return False
+    except sr.RequestError as e:
+        disable_wake_word(f"PocketSphinx unavailable ({e})")
+        return False
+
+def adapt_energy_threshold(recognizer, energy, chunk_seconds):
+    """Track ambient noise on silent chunks, the same way Recognizer.listen() does."""
+    if not recognizer.dynamic_energy_threshold:
+        return
+    damping = recognizer.dynamic_energy_adjustment_damping ** chunk_seconds
+    target = energy * recognizer.dynamic_energy_ratio
+    recognizer.energy_threshold = recognizer.energy_threshold * damping + target * (1 - damping)
+
+def mic_capture_worker(source):
+    """Reads the microphone continuously. Does nothing else so it never misses audio."""
+    errors = 0
+    while state.is_listening:
+        try:
+            chunk = source.stream.read(source.CHUNK)
+        except Exception as e:
+            errors += 1
+            print(f"Capture Error ({errors}/{MAX_CAPTURE_ERRORS}): {e}")
+            if errors >= MAX_CAPTURE_ERRORS:
+                print(">>> Microphone unavailable - stopping voice capture")
+                return
+            # Back off instead of spinning on a dead stream
+            time.sleep(min(2.0, 0.1 * 2 ** errors))
+            continue
+        errors = 0
+        put_dropping_oldest(audio_chunks, chunk)
+
+def phrase_segmenter_worker(recognizer, source):
+    """Splits the chunk stream into phrases by energy and checks idle phrases for the wake word."""
+    chunk_seconds = source.CHUNK / source.SAMPLE_RATE
+    pre_roll = collections.deque(maxlen=max(1, int(PRE_ROLL_SECONDS / chunk_seconds)))
+    phrase = None
+    silent_chunks = 0
+    was_speaking = False
+
+    while state.is_listening:
+        chunk = audio_chunks.get()
+
+        # Drop MoodNest's own voice instead of feeding it back as user speech
+        if speaking.is_set():
+            phrase = None
+            pre_roll.clear()
+            was_speaking = True
+            continue
+        if was_speaking:
+            # Playback just ended: discard anything captured during it that is still queued
+            while True:
+                try:
+                    audio_chunks.get_nowait()
+                except queue.Empty:
+                    break
+            pre_roll.clear()
+            was_speaking = False
+            continue
+
+        energy = chunk_rms(chunk)
+        loud = energy > recognizer.energy_threshold
+
+        if phrase is None:
+            pre_roll.append(chunk)
+            if loud:
+                phrase = list(pre_roll)
+                pre_roll.clear()
+                silent_chunks = 0
+            else:
+                adapt_energy_threshold(recognizer, energy, chunk_seconds)
+            continue
+
+        phrase.append(chunk)
+        silent_chunks = 0 if loud else silent_chunks + 1
+        duration = len(phrase) * chunk_seconds
+        if silent_chunks * chunk_seconds < END_SILENCE_SECONDS and duration < MAX_PHRASE_SECONDS:
+            continue
+
+        frames, phrase = b"".join(phrase), None
+        if duration - silent_chunks * chunk_seconds < MIN_PHRASE_SECONDS:
+            continue
+        audio = sr.AudioData(frames, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+        try:
+            if state.is_active:
+                # Already awake: every phrase is conversation
+                put_dropping_oldest(utterances, ("speech", audio))
+            elif wake_word_enabled.is_set() and heard_wake_word(recognizer, audio):
+                put_dropping_oldest(utterances, ("wake", audio))
+        except Exception as e:
+            print(f"Wake Word Error: {e}")
+
+def interaction_worker(recognizer):
+    """Runs full STT + Gemini + playback off the listening path."""
+    while state.is_listening:
+        kind, audio = utterances.get()
+        try:
+            if kind == "wake":
+                # Check if already active to avoid double-activation
+                if not state.is_active:
+                    print("!!! ACTIVATING MOODNEST !!!")
+                    with state_lock:
+                        state.is_active = True
+                    # Immediately trigger the first greeting
+                    process_interaction("Hello! MoodNest is active. How are you feeling today?")
+                continue
+
+            text = recognizer.recognize_google(audio).lower()
+            print(f"DEBUG: Heard '{text}'")
+            # Normal conversation flow
+            process_interaction(text, is_user_speech=True)
+
+        except sr.UnknownValueError:
+            continue # Ignore background noise
+        except Exception as e:
+            print(f"Worker Error: {e}")
+            continue
 
 def voice_background_worker():
     """Independent thread for continuous microphone listening."""
     recognizer = sr.Recognizer()
     mic = sr.Microphone()
     
+    try:
+        import pocketsphinx  # noqa: F401 - only checked here, speech_recognition loads it
+    except ImportError:
+        disable_wake_word("pocketsphinx is not installed")
+
     with mic as source:
         recognizer.adjust_for_ambient_noise(source, duration=1)
-        print(">>> Microphone Ready. Listening for wake word 'Mood'...")
-        
-        while state.is_listening:
-            try:
-                # Listen with a shorter phrase limit to keep the loop snappy
-                audio = recognizer.listen(source, timeout=None, phrase_time_limit=3)
-                text = recognizer.recognize_google(audio).lower()
-                print(f"DEBUG: Heard '{text}'")
-
-                # Keyword Activation
-                if "mood" in text:
-                    # Check if already active to avoid double-activation
-                    if not state.is_active:
-                        print("!!! ACTIVATING MOODNEST !!!")
-                        with state_lock:
-                            state.is_active = True
-                        # Immediately trigger the first greeting
-                        process_interaction("Hello! MoodNest is active. How are you feeling today?")
-                    else:
-                        # If already active, just process the text as a command
-                        process_interaction(text, is_user_speech=True)
-                
-                elif state.is_active:
-                    # Normal conversation flow
-                    process_interaction(text, is_user_speech=True)
-
-            except sr.UnknownValueError:
-                continue # Ignore background noise
-            except Exception as e:
-                print(f"Worker Error: {e}")
-                continue
+        if wake_word_enabled.is_set():
+            print(f">>> Microphone Ready. Listening for wake word '{WAKE_WORD.capitalize()}'...")
+        else:
+            print(">>> Microphone Ready. Waiting for POST /action/wake")
+
+        threading.Thread(target=phrase_segmenter_worker, args=(recognizer, source), daemon=True).start()
+        threading.Thread(target=interaction_worker, args=(recognizer,), daemon=True).start()
+        mic_capture_worker(source)
 
 # --- 5. FASTAPI ENDPOINTS ---
 
@@ -0,0 +1,312 @@
+"""
+Append-only mood event log for MoodNest.
+
+Every vibe detection, confirmation and manual change is written as a fixed-size
+binary record. New events go to an "active" file; once it fills up it is sealed
+into a numbered segment. A background thread merges runs of similar-sized
+segments (size-tiered), so each event is rewritten only O(log n) times and
+compaction never runs on the request path. Queries memory-map the sealed segments and aggregate them
+with vectorized NumPy, so a year of events is summarized in milliseconds.
+"""
+import os
+import re
+import time
+import threading
+
+import numpy as np
+
+# Stable on-disk codes - only ever append to these tuples, never reorder them
+VIBES = ("neutral", "happy", "sad", "angry")
+SOURCES = ("detected", "confirmed", "manual", "reset")
+
+# 16 bytes per event: epoch milliseconds, vibe code, source code, confidence
+EVENT_DTYPE = np.dtype([
+    ("ts_ms", "<i8"),
+    ("vibe", "u1"),
+    ("source", "u1"),
+    ("_pad", "u2"),
+    ("confidence", "<f4"),
+])
+
+ACTIVE_NAME = "active.bin"
+SEGMENT_RE = re.compile(r"^seg-(\d{10})-(\d{10})\.bin$")
+
+# Seal the active file after this many events (~1 MB)
+SEGMENT_EVENTS = 65536
+# Merge once this many adjacent segments fall in the same size tier
+MERGE_FANOUT = 4
+
+
+class MoodLog:
+    """Thread-safe append-only event log backed by memory-mapped segments."""
+
+    def __init__(self, directory, segment_events=SEGMENT_EVENTS, fanout=MERGE_FANOUT):
+        self.directory = directory
+        self.segment_events = segment_events
+        self.fanout = fanout
+        self._lock = threading.Lock()
+        self._maps = {}  # segment filename -> np.memmap
+        self._merge_lock = threading.Lock()  # One merger at a time
+        self._merger = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = self._load_segments()
+        self._next_seq = self._segments[-1][1] + 1 if self._segments else 1
+        self._active_path = os.path.join(directory, ACTIVE_NAME)
+        self._recover_active()
+        self._active = open(self._active_path, "ab")
+        self._active_count = self._active.tell() // EVENT_DTYPE.itemsize
+        self._last_ts = self._read_last_ts()
+
+    # --- Writing ---
+
+    def record(self, vibe, source, confidence=None):
+        """Append one event. Unknown vibes or sources are ignored."""
+        if vibe not in VIBES or source not in SOURCES:
+            return
+        event = np.zeros(1, dtype=EVENT_DTYPE)
+        event["vibe"] = VIBES.index(vibe)
+        event["source"] = SOURCES.index(source)
+        event["confidence"] = np.nan if confidence is None else float(confidence)
+
+        with self._lock:
+            # Keep timestamps monotonic so segments stay sorted for searchsorted
+            ts_ms = max(int(time.time() * 1000), self._last_ts)
+            event["ts_ms"] = ts_ms
+            self._last_ts = ts_ms
+            self._active.write(event.tobytes())
+            self._active.flush()
+            self._active_count += 1
+            if self._active_count >= self.segment_events:
+                self._seal_active()
+                start_merger = self._next_merge_run() is not None and (
+                    self._merger is None or not self._merger.is_alive()
+                )
+                if start_merger:
+                    self._merger = threading.Thread(target=self._merge_tiers, name="mood-log-merge", daemon=True)
+                    self._merger.start()
+
+    def compact(self):
+        """Seal the active file and merge all sealed segments into one (blocking, for maintenance)."""
+        with self._merge_lock:
+            with self._lock:
+                if self._active_count:
+                    self._seal_active()
+                run = list(self._segments)
+            if len(run) > 1:
+                self._merge(run)
+
+    def close(self):
+        merger = self._merger
+        if merger is not None:
+            merger.join()
+        with self._lock:
+            self._active.close()
+            self._maps.clear()
+
+    # --- Querying ---
+
+    def summary(self, since=None, until=None, tz_offset_minutes=0):
+        """
+        Aggregate events in [since, until) (epoch seconds, either may be None).
+        Hour-of-day and weekday buckets are shifted by tz_offset_minutes so the
+        caller gets distributions in their local time.
+        """
+        lo = None if since is None else int(since * 1000)
+        hi = None if until is None else int(until * 1000)
+        offset_ms = int(tz_offset_minutes) * 60_000
+        n_vibes, n_sources = len(VIBES), len(SOURCES)
+
+        totals = np.zeros(n_vibes * n_sources, dtype=np.int64)
+        by_hour = np.zeros(24 * n_vibes, dtype=np.int64)
+        by_weekday = np.zeros(7 * n_vibes, dtype=np.int64)
+        conf_sum = np.zeros(n_vibes, dtype=np.float64)
+        conf_count = np.zeros(n_vibes, dtype=np.int64)
+        first_ts = last_ts = None
+
+        for events in self._snapshot():
+            start = 0 if lo is None else int(np.searchsorted(events["ts_ms"], lo, side="left"))
+            stop = len(events) if hi is None else int(np.searchsorted(events["ts_ms"], hi, side="left"))
+            if start >= stop:
+                continue
+            chunk = events[start:stop]
+            ts = chunk["ts_ms"] + offset_ms
+            vibe = chunk["vibe"].astype(np.int64)
+            source = chunk["source"].astype(np.int64)
+
+            totals += np.bincount(vibe * n_sources + source, minlength=n_vibes * n_sources)
+            hour = (ts // 3_600_000) % 24
+            by_hour += np.bincount(hour * n_vibes + vibe, minlength=24 * n_vibes)
+            # 1970-01-01 was a Thursday; shift so Monday == 0
+            weekday = (ts // 86_400_000 + 3) % 7
+            by_weekday += np.bincount(weekday * n_vibes + vibe, minlength=7 * n_vibes)
+
+            confidence = chunk["confidence"]
+            has_conf = ~np.isnan(confidence)
+            conf_sum += np.bincount(vibe[has_conf], weights=confidence[has_conf], minlength=n_vibes)
+            conf_count += np.bincount(vibe[has_conf], minlength=n_vibes)
+
+            if first_ts is None:
+                first_ts = int(chunk["ts_ms"][0])
+            last_ts = int(chunk["ts_ms"][-1])
+
+        totals = totals.reshape(n_vibes, n_sources)
+        by_hour = by_hour.reshape(24, n_vibes)
+        by_weekday = by_weekday.reshape(7, n_vibes)
+        mean_conf = np.divide(conf_sum, conf_count, out=np.full(n_vibes, np.nan), where=conf_count > 0)
+
+        return {
+            "total_events": int(totals.sum()),
+            "first_event": None if first_ts is None else first_ts / 1000,
+            "last_event": None if last_ts is None else last_ts / 1000,
+            "by_vibe": {v: int(totals[i].sum()) for i, v in enumerate(VIBES)},
+            "by_source": {s: int(totals[:, j].sum()) for j, s in enumerate(SOURCES)},
+            "by_vibe_and_source": {
+                v: {s: int(totals[i, j]) for j, s in enumerate(SOURCES)} for i, v in enumerate(VIBES)
+            },
+            "by_hour": [{v: int(row[i]) for i, v in enumerate(VIBES)} for row in by_hour],
+            "by_weekday": [{v: int(row[i]) for i, v in enumerate(VIBES)} for row in by_weekday],
+            "mean_confidence": {
+                v: None if np.isnan(mean_conf[i]) else round(float(mean_conf[i]), 4)
+                for i, v in enumerate(VIBES)
+            },
+        }
+
+    # --- Internals ---
+
+    def _snapshot(self):
+        """Return sorted event arrays: memmapped segments plus the active tail."""
+        with self._lock:
+            arrays = [self._map(name) for name in self._segment_names()]
+            if self._active_count:
+                # The active file is small (< SEGMENT_EVENTS), so reading it is cheap
+                arrays.append(np.fromfile(self._active_path, dtype=EVENT_DTYPE, count=self._active_count))
+        return arrays
+
+    def _map(self, name):
+        events = self._maps.get(name)
+        if events is None:
+            events = np.memmap(os.path.join(self.directory, name), dtype=EVENT_DTYPE, mode="r")
+            self._maps[name] = events
+        return events
+
+    def _segment_names(self):
+        return [f"seg-{first:010d}-{last:010d}.bin" for first, last in self._segments]
+
+    def _load_segments(self):
+        """Find sealed segments, dropping any left over from an interrupted compaction."""
+        ranges = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_RE.match(name)
+            if match:
+                ranges.append((int(match.group(1)), int(match.group(2))))
+            elif name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
+        # Widest range first, so a merged segment wins over the pieces it covers
+        ranges.sort(key=lambda r: (r[0], -r[1]))
+        kept = []
+        for first, last in ranges:
+            if kept and last <= kept[-1][1]:
+                os.remove(os.path.join(self.directory, f"seg-{first:010d}-{last:010d}.bin"))
+                continue
+            kept.append((first, last))
+        return kept
+
+    def _recover_active(self):
+        """Trim a partially written trailing record after a crash."""
+        if not os.path.exists(self._active_path):
+            return
+        size = os.path.getsize(self._active_path)
+        extra = size % EVENT_DTYPE.itemsize
+        if extra:
+            with open(self._active_path, "r+b") as f:
+                f.truncate(size - extra)
+
+    def _read_last_ts(self):
+        arrays = self._snapshot()
+        for events in reversed(arrays):
+            if len(events):
+                return int(events["ts_ms"][-1])
+        return 0
+
+    def _seal_active(self):
+        self._active.close()
+        seq = self._next_seq
+        self._next_seq += 1
+        name = f"seg-{seq:010d}-{seq:010d}.bin"
+        os.replace(self._active_path, os.path.join(self.directory, name))
+        self._segments.append((seq, seq))
+        self._active = open(self._active_path, "ab")
+        self._active_count = 0
+
+    def _segment_events(self, first, last):
+        return os.path.getsize(os.path.join(self.directory, f"seg-{first:010d}-{last:010d}.bin")) // EVENT_DTYPE.itemsize
+
+    def _tier(self, events):
+        """Size tier: 0 for one sealed segment, +1 for every `fanout` times larger."""
+        tier, size = 0, self.segment_events * self.fanout
+        while events >= size:
+            tier += 1
+            size *= self.fanout
+        return tier
+
+    def _next_merge_run(self):
+        """First run of `fanout` adjacent segments in the same tier, or None. Called with the lock held."""
+        run, run_tier = [], None
+        for first, last in self._segments:
+            tier = self._tier(self._segment_events(first, last))
+            if tier != run_tier:
+                run, run_tier = [], tier
+            run.append((first, last))
+            if len(run) == self.fanout:
+                return run
+        return None
+
+    def _merge_tiers(self):
+        """Background thread: keep merging same-tier runs until none are left."""
+        with self._merge_lock:
+            while True:
+                with self._lock:
+                    run = self._next_merge_run()
+                if run is None:
+                    return
+                try:
+                    self._merge(run)
+                except OSError as e:
+                    print(f"⚠️ Mood log merge failed: {e}")
+                    return
+
+    def _merge(self, run):
+        """
+        Merge an adjacent run of sealed segments into one. Sealed segments never
+        change, so the copy happens without the lock; only the swap takes it.
+        """
+        old_names = [f"seg-{first:010d}-{last:010d}.bin" for first, last in run]
+        first, last = run[0][0], run[-1][1]
+        merged_name = f"seg-{first:010d}-{last:010d}.bin"
+        tmp_path = os.path.join(self.directory, merged_name + ".tmp")
+
+        # Segments are already in time order, so merging is a plain concatenation
+        with open(tmp_path, "wb") as out:
+            for name in old_names:
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    while True:
+                        block = f.read(1 << 20)
+                        if not block:
+                            break
+                        out.write(block)
+            out.flush()
+            os.fsync(out.fileno())
+
+        with self._lock:
+            os.replace(tmp_path, os.path.join(self.directory, merged_name))
+            index = self._segments.index(run[0])
+            self._segments[index:index + len(run)] = [(first, last)]
+            for name in old_names:
+                self._maps.pop(name, None)
+        for name in old_names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass  # Still mapped by a reader (Windows); dropped on next startup
+        print(f"🗜️ Mood log merged {len(old_names)} segments into {merged_name}")
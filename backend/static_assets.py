@@ -0,0 +1,108 @@
+"""
+Static file serving for the built frontend, 3D models and music.
+
+On top of Starlette's StaticFiles (which already handles ETag/If-None-Match and
+Range requests) this serves precompressed `.br` / `.gz` siblings produced by
+build_assets.py when the client accepts them, and sets Cache-Control so
+content-hashed build output (opt-in per mount) is cached forever while
+everything else is revalidated with a cheap 304.
+"""
+import os
+import re
+import mimetypes
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Vite output looks like assets/index-B7x_3kQa.js (exactly 8 hash characters)
+HASHED_NAME_RE = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+mimetypes.add_type("model/gltf-binary", ".glb")
+mimetypes.add_type("model/gltf+json", ".gltf")
+
+
+def accepted_encodings(header):
+    """Encodings from an Accept-Encoding header, skipping any with q=0."""
+    accepted = set()
+    for part in header.split(","):
+        name, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+        if name.strip() and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    def __init__(self, *args, hashed_dir=None, **kwargs):
+        """
+        hashed_dir: subdirectory (e.g. "assets" for a Vite build) whose files carry a
+        content hash in their name and may be cached as immutable. Without it every
+        file is revalidated, which is what mounts with hand-named files (/music) need.
+        """
+        super().__init__(*args, **kwargs)
+        self.hashed_dir = hashed_dir
+
+    def is_content_hashed(self, full_path):
+        if self.hashed_dir is None or self.directory is None:
+            return False
+        relative = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+        return relative.startswith(self.hashed_dir.strip("/") + "/") and bool(
+            HASHED_NAME_RE.search(os.path.basename(full_path))
+        )
+
+    async def get_response(self, path, scope):
+        # The .br/.gz siblings only exist to be negotiated for their original; served
+        # directly they would go out with the original's type and no Content-Encoding
+        if path.lower().endswith(tuple(suffix for _, suffix in ENCODINGS)):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        full_path = os.fspath(full_path)
+        # The content type always comes from the original name, not the .br/.gz variant
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        headers = {
+            "Cache-Control": IMMUTABLE if self.is_content_hashed(full_path) else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+
+        # Byte ranges are served from the identity file so offsets stay meaningful
+        if "range" not in request_headers:
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            for encoding, suffix in ENCODINGS:
+                if encoding not in accepted:
+                    continue
+                try:
+                    variant_stat = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                full_path, stat_result = full_path + suffix, variant_stat
+                headers["Content-Encoding"] = encoding
+                break
+
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            media_type=media_type,
+            headers=headers,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,96 @@
+"""
+Shared, keep-alive HTTP clients for upstream providers.
+
+Each provider gets one pooled httpx client for the lifetime of the app, so
+requests reuse warm TCP/TLS connections instead of paying a DNS lookup and TLS
+handshake on the request path. HTTP/2 is used when the `h2` package is
+installed. Every client counts requests vs. newly opened connections, so
+connection reuse can be checked at /upstream/stats.
+"""
+import os
+import threading
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Tunables (override with environment variables)
+MAX_CONNECTIONS = int(os.getenv("MOODNEST_HTTP_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("MOODNEST_HTTP_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("MOODNEST_HTTP_KEEPALIVE_EXPIRY", "120"))
+TIMEOUT = float(os.getenv("MOODNEST_HTTP_TIMEOUT", "60"))
+
+
+class ConnectionStats:
+    """Counts requests and new connections using httpcore's trace hooks."""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    def on_request(self, request):
+        request.extensions["trace"] = self._trace
+        with self._lock:
+            self.requests += 1
+
+    def _trace(self, event, info):
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    def snapshot(self):
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reused_connections": reused,
+                "reuse_ratio": round(reused / self.requests, 3) if self.requests else None,
+            }
+
+
+class UpstreamPool:
+    """One pooled httpx.Client per provider, opened and closed with the app lifespan."""
+
+    def __init__(self):
+        self._clients = {}
+        self._stats = {}
+
+    def client(self, provider, verify=True):
+        """Return the shared client for `provider`, creating it on first use."""
+        if provider not in self._clients:
+            stats = ConnectionStats()
+            self._clients[provider] = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                verify=verify,
+                timeout=TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                event_hooks={"request": [stats.on_request]},
+            )
+            self._stats[provider] = stats
+        return self._clients[provider]
+
+    def stats(self):
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "providers": {name: stats.snapshot() for name, stats in self._stats.items()},
+        }
+
+    def close(self):
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
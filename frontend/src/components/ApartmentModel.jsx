@@ -1,6 +1,9 @@
 import { useRef, useEffect, useState } from "react";
 import { useGLTF } from "@react-three/drei";
 import * as THREE from "three";
+// Imported (not served from /public) so the build gives it a content-hashed,
+// long-cacheable URL
+import apartmentUrl from "../assets/apartment_final.glb?url";
 
 /**
  * ApartmentModel - Interactive 3D apartment with mood-responsive lighting
@@ -39,8 +42,8 @@ export default function ApartmentModel({ mood = "neutral", ...props }) {
   // Keep track of all the lamp meshes (for color updates)
   const [lampMeshes, setLampMeshes] = useState([]);
 
-  // Load the 3D apartment model from the public folder
-  const { scene } = useGLTF("/apartment2.glb");
+  // Load the 3D apartment model
+  const { scene } = useGLTF(apartmentUrl);
 
   /**
    * Initial setup - runs once when the model is loaded
@@ -216,4 +219,4 @@ export default function ApartmentModel({ mood = "neutral", ...props }) {
 }
 
 // Preload the model for faster initial load
-useGLTF.preload("/apartment2.glb");
+useGLTF.preload(apartmentUrl);
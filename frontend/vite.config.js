@@ -5,4 +5,8 @@ import tailwindcss from "@tailwindcss/vite";
 // https://vite.dev/config/
 export default defineConfig({
   plugins: [react(), tailwindcss()],
+  // Relative URLs so the build also works when the backend serves it under /app
+  base: "./",
+  // 3D models are imported from src/assets so they get content-hashed names
+  assetsInclude: ["**/*.glb"],
 });